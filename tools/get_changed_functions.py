@@ -6,19 +6,39 @@ import os
 import re
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from textwrap import indent
-from typing import Dict, List, Optional, Tuple, Set
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Set
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used when orjson is missing
+    orjson = None
+
+try:
+    import pygit2
+    from pygit2.enums import DeltaStatus, DiffOption
+except ImportError:  # optional: the git CLI is used when pygit2 is missing
+    pygit2 = None
 
 # ----------------- basic utils & regex ----------------- #
 PY_FUNC_DEF = re.compile(r"^\s*def\s+([A-Za-z_]\w*)\s*\(")
 CALL_RE = re.compile(r"[A-Za-z_]\w*\s*\(")
 CALL_RE_WITH_PATH = re.compile(r"(?:/\S+::)?([A-Za-z_]\w*)\s*\(")
 
-DEF_LINE_RE = re.compile(r"^\s*def\s+[A-Za-z_]\w*\s*\((.*)\)\s*(?:->\s*(.*))?:\s*$")
+DEF_LINE_RE = re.compile(r"^\s*def\s+(?P<name>[A-Za-z_]\w*)\s*\((?P<params>.*)\)\s*(?:->\s*(.*))?:\s*$")
+DEF_NAME_RE = re.compile(rb"\s*(?:async\s+)?def\s+")
+HUNK_HEADER_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+HUNK_LINE_HEADS = frozenset((b"+", b"-", b" ", b"\\"))
 
 
-def run_git_diff(repo: str) -> Tuple[int, str, str]:
+def run_git_diff(repo: str) -> Iterator[bytes]:
+    """
+    Yield raw `git diff` output lines as git writes them, so parse_diff works
+    on the first files while git is still diffing the rest.
+    """
     cmd = [
         "git",
         "-C",
@@ -29,32 +49,102 @@ def run_git_diff(repo: str) -> Tuple[int, str, str]:
         "-b",
         "-w",
         "--ignore-blank-lines",
+        "-U0",
     ]
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    return proc.returncode, proc.stdout, proc.stderr
+    # stdout stays bytes: parse_diff decodes only what it keeps.
+    # stderr is discarded rather than piped: an unread pipe could fill and stall git.
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        yield from proc.stdout
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+
+def diff_files_pygit2(repo: str) -> List[dict]:
+    """
+    In-process equivalent of run_git_diff + parse_diff (before filtering) using libgit2.
+    Mirrors the CLI flags: whitespace/blank-line insensitive, -U0, --relative.
+    Raises ValueError when repo is not inside a work tree; get_diff_files then
+    falls back to the git CLI.
+    """
+    path = pygit2.discover_repository(repo)
+    if path is None:
+        raise ValueError(f"no git repository found at {repo}")
+    repository = pygit2.Repository(path)
+    if repository.workdir is None:
+        raise ValueError(f"{path} is a bare repository")
+    # workdir comes back symlink-resolved, so resolve repo too before comparing
+    prefix = os.path.relpath(os.path.realpath(repo), os.path.realpath(repository.workdir)).replace("\\", "/")
+    if prefix == ".." or prefix.startswith("../"):
+        raise ValueError(f"{repo} is outside the work tree {repository.workdir}")
+    prefix = "" if prefix == "." else prefix + "/"
+    flags = (
+        DiffOption.IGNORE_WHITESPACE
+        | DiffOption.IGNORE_WHITESPACE_CHANGE
+        | DiffOption.IGNORE_WHITESPACE_EOL
+        | DiffOption.IGNORE_BLANK_LINES
+    )
+    files = []
+    for patch in repository.diff(flags=flags, context_lines=0):
+        delta = patch.delta
+        path = delta.new_file.path
+        if not path.startswith(prefix):
+            continue
+        current = {
+            "file": None if delta.status == DeltaStatus.DELETED else path[len(prefix):],
+            "hunks": [],
+        }
+        for hunk in patch.hunks:
+            current["hunks"].append({
+                "header": hunk.header.rstrip("\r\n"),
+                "lines": [
+                    line.origin + _decode(line.raw_content).rstrip("\r\n")
+                    for line in hunk.lines
+                    if line.origin in ("+", "-", " ")
+                ],
+            })
+        files.append(current)
+    return files
+
+
+def get_diff_files(repo: str) -> Iterator[dict]:
+    """Changed files with their important hunks, via pygit2 when installed, else the git CLI."""
+    if pygit2 is not None:
+        try:
+            return filter_important_hunks(diff_files_pygit2(repo))
+        except (pygit2.GitError, KeyError, ValueError):
+            pass
+    return parse_diff(run_git_diff(repo))
 
 
 # ----------------- diff parsing & hunk heuristics ----------------- #
 import difflib
 
 
+ANNOTATION_RE = re.compile(r"\s*:\s*[^,=\)\]]+")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
 def _strip_type_annotations_from_params(params_text: str) -> str:
-    res = re.sub(r"\s*:\s*[^,=\)\]]+", "", params_text)
-    res = re.sub(r"\s+", " ", res).strip()
+    res = ANNOTATION_RE.sub("", params_text)
+    res = WHITESPACE_RE.sub(" ", res).strip()
     return res
 
 
+@lru_cache(maxsize=2048)
 def _normalize_def_line(line: str) -> Optional[str]:
     m = DEF_LINE_RE.match(line)
     if not m:
         return None
-    params_text = m.group(1) or ""
-    params_no_ann = _strip_type_annotations_from_params(params_text)
-    name_m = re.match(r"^\s*def\s+([A-Za-z_]\w*)\s*\(", line)
-    name = name_m.group(1) if name_m else ""
-    return f"def {name}({params_no_ann})"
+    params_no_ann = _strip_type_annotations_from_params(m.group("params") or "")
+    return f"def {m.group('name')}({params_no_ann})"
+
+
+TRIVIAL_DEF_RATIO = 0.85
 
 
+@lru_cache(maxsize=4096)
 def _def_line_change_is_trivial(removed: str, added: str) -> bool:
     norm_removed = _normalize_def_line(removed)
     norm_added = _normalize_def_line(added)
@@ -62,109 +152,149 @@ def _def_line_change_is_trivial(removed: str, added: str) -> bool:
         return False
     if norm_removed == norm_added:
         return True
-    ratio = difflib.SequenceMatcher(None, norm_removed, norm_added).ratio()
-    return ratio >= 0.85
+    sm = difflib.SequenceMatcher(None, norm_removed, norm_added)
+    # cheap upper bounds first; ratio() is quadratic in the worst case
+    if sm.real_quick_ratio() < TRIVIAL_DEF_RATIO or sm.quick_ratio() < TRIVIAL_DEF_RATIO:
+        return False
+    return sm.ratio() >= TRIVIAL_DEF_RATIO
 
 
 def is_important_hunk(hunk_lines: List[str]) -> bool:
-    added = [l for l in hunk_lines if l.startswith("+") and not l.startswith("+++")]
-    removed = [l for l in hunk_lines if l.startswith("-") and not l.startswith("---")]
-    if not added and not removed:
-        return False
-    total_changed_count = len(added) + len(removed)
-    if total_changed_count == 1:
-        line = (added[0] if added else removed[0])[1:]
-        if PY_FUNC_DEF.match(line):
-            return False
-        if CALL_RE.search(line):
-            return True
-        return False
-
-    trivial_pairs = 0
-    def_pairs_checked = 0
-    for r in removed:
-        r_line = r[1:]
-        if not PY_FUNC_DEF.match(r_line):
-            continue
-        r_name = PY_FUNC_DEF.match(r_line).group(1)
-        for a in added:
-            a_line = a[1:]
-            if not PY_FUNC_DEF.match(a_line):
+    # one pass: count changed lines, bucket def lines by name and note any
+    # substantive (non-def, non-import, non-comment) added line
+    changed = 0
+    line = ""
+    added_defs: Dict[str, List[str]] = {}
+    removed_defs: List[Tuple[str, str]] = []
+    has_non_def_added = False
+    for l in hunk_lines:
+        if l.startswith("+"):
+            if l.startswith("+++"):
                 continue
-            a_name = PY_FUNC_DEF.match(a_line).group(1)
-            if a_name == r_name:
-                def_pairs_checked += 1
-                if _def_line_change_is_trivial(r_line, a_line):
-                    trivial_pairs += 1
-
-    non_def_added = []
-    for a in added:
-        a_line = a[1:].strip()
-        if not a_line:
-            continue
-        if PY_FUNC_DEF.match(a_line):
-            continue
-        if a_line.startswith("from ") or a_line.startswith("import "):
-            continue
-        if a_line.startswith("#"):
+            changed += 1
+            line = l[1:]
+            if m := PY_FUNC_DEF.match(line):
+                added_defs.setdefault(m.group(1), []).append(line)
+            elif not has_non_def_added:
+                stripped = line.strip()
+                if stripped and not stripped.startswith(("from ", "import ", "#")):
+                    has_non_def_added = True
+        elif l.startswith("-"):
+            if l.startswith("---"):
+                continue
+            changed += 1
+            line = l[1:]
+            if m := PY_FUNC_DEF.match(line):
+                removed_defs.append((m.group(1), line))
+        else:
             continue
-        non_def_added.append(a_line)
+        # a substantive added line makes any multi-line hunk important
+        if has_non_def_added and changed > 1:
+            return True
 
-    if def_pairs_checked > 0 and def_pairs_checked == trivial_pairs and len(non_def_added) == 0:
+    if not changed:
         return False
+    if changed == 1:
+        if added_defs or removed_defs:
+            return False
+        return CALL_RE.search(line) is not None
 
-    for a in added:
-        if CALL_RE.search(a[1:]):
-            return True
+    # unimportant only if every removed/added def pair (by name) is a trivial change
+    def_pairs_checked = 0
+    for name, r_line in removed_defs:
+        for a_line in added_defs.get(name, ()):
+            def_pairs_checked += 1
+            if not _def_line_change_is_trivial(r_line, a_line):
+                return True
+    return def_pairs_checked == 0
 
-    return True
 
+def _decode(raw: bytes) -> str:
+    return raw.decode("utf-8", errors="replace")
 
-def parse_diff(diff_text: str):
-    files = []
+
+def parse_diff(diff_lines: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Stream raw `git diff` output lines into {"file", "hunks": [{"header", "lines"}]}.
+    Single pass: each hunk is judged as soon as it ends and dropped if unimportant,
+    and each file is yielded as soon as its section ends (only if a hunk survived).
+    """
     current = None
-    for line in diff_text.splitlines():
-        if line.startswith("diff --git"):
-            if current:
-                files.append(current)
+    hunk = None
+    for raw in diff_lines:
+        # fast path: inside a hunk every body line starts with one of +/-/space/\
+        if hunk is not None and raw[:1] in HUNK_LINE_HEADS:
+            hunk["lines"].append(_decode(raw).rstrip("\r\n"))
+        elif raw.startswith(b"diff --git"):
+            if hunk is not None and is_important_hunk(hunk["lines"]):
+                current["hunks"].append(hunk)
+            hunk = None
+            if current is not None and current["hunks"]:
+                yield current
             current = {"file": None, "hunks": []}
-        elif line.startswith("+++ b/"):
-            if current:
-                current["file"] = line.replace("+++ b/", "").strip()
-        elif line.startswith("@@"):
-            if current is None:
-                continue
-            current["hunks"].append({"header": line, "lines": []})
-        elif current and current["hunks"]:
-            current["hunks"][-1]["lines"].append(line)
-    if current:
-        files.append(current)
-
-    filtered_files = []
+        elif current is None:
+            continue
+        elif raw.startswith(b"+++ b/"):
+            current["file"] = _decode(raw[6:]).strip()
+        elif raw.startswith(b"@@"):
+            if hunk is not None and is_important_hunk(hunk["lines"]):
+                current["hunks"].append(hunk)
+            hunk = {"header": _decode(raw).rstrip("\r\n"), "lines": []}
+        elif hunk is not None:
+            hunk["lines"].append(_decode(raw).rstrip("\r\n"))
+    if hunk is not None and is_important_hunk(hunk["lines"]):
+        current["hunks"].append(hunk)
+    if current is not None and current["hunks"]:
+        yield current
+
+
+def filter_important_hunks(files: Iterable[dict]) -> Iterator[dict]:
+    """Apply is_important_hunk to already-split files (the pygit2 path)."""
     for f in files:
         important_hunks = [h for h in f["hunks"] if is_important_hunk(h["lines"])]
         if important_hunks:
             f["hunks"] = important_hunks
-            filtered_files.append(f)
+            yield f
+
 
-    return filtered_files
+def hunk_new_range(header: str) -> Optional[Tuple[int, int]]:
+    """Return the (first, last) new-file lines a hunk touches."""
+    m = HUNK_HEADER_RE.match(header)
+    if not m:
+        return None
+    start = int(m.group(1))
+    count = int(m.group(2)) if m.group(2) is not None else 1
+    # pure deletions report the line before the removed block
+    return start, start + max(count, 1) - 1
 
 
-def find_changed_functions(parsed_files):
-    changed = {}
+def changed_file_ranges(parsed_files) -> Iterator[Tuple[str, List[Tuple[int, int]]]]:
+    """Yield (file, new-line ranges of its hunks) for each changed .py file."""
     for f in parsed_files:
         file_path = f["file"]
-        funcs: Set[str] = set()
-        for h in f["hunks"]:
-            for line in h["lines"]:
-                if line.startswith(("+", " ")):
-                    stripped = line[1:]
-                    m = PY_FUNC_DEF.match(stripped)
-                    if m:
-                        funcs.add(m.group(1))
-        if funcs:
-            changed[file_path] = funcs
-    return changed
+        if not file_path or not file_path.endswith(".py"):
+            continue
+        yield file_path, [r for r in (hunk_new_range(h["header"]) for h in f["hunks"]) if r]
+
+
+def changed_functions_in_file(path: str, ranges: List[Tuple[int, int]]) -> Set[str]:
+    """
+    Names of the functions in path whose source range overlaps one of ranges.
+    The diff carries no context lines (-U0), so ranges are matched against the
+    file's AST instead of looking for def lines in the hunk text.
+    """
+    try:
+        tree = _load_ast(path)[1]
+    except Exception:
+        return set()
+    funcs: Set[str] = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+        if any(first <= node.end_lineno and last >= start for first, last in ranges):
+            funcs.add(node.name)
+    return funcs
 
 
 # ----------------- utilities for canonical ids ----------------- #
@@ -175,24 +305,51 @@ def rel_path(repo_root: str, abs_path: str) -> str:
         return abs_path.replace("\\", "/")
 
 
+def write_json(file_path: str, data) -> None:
+    """Write data as indented JSON via a temp file + rename, so readers never see a partial file."""
+    path = Path(file_path)
+    tmp = path.with_name(path.name + ".tmp")
+    if orjson is not None:
+        tmp.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    else:
+        with tmp.open("w") as f:
+            json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def print_json(data) -> None:
+    """Print data as JSON on stdout: indented on a terminal, compact when piped to another program."""
+    pretty = sys.stdout.isatty()
+    if orjson is not None:
+        option = orjson.OPT_APPEND_NEWLINE | (orjson.OPT_INDENT_2 if pretty else 0)
+        sys.stdout.write(orjson.dumps(data, option=option).decode())
+    elif pretty:
+        print(json.dumps(data, indent=2))
+    else:
+        print(json.dumps(data, separators=(",", ":")))
+
+
 def make_full_id(rel_file: str, fn_name: str) -> str:
     rel_file = rel_file.lstrip("/")  # remove accidental leading /
     return f"/{rel_file}::{fn_name}"  # always add leading /
 
 
 # ----------------- function extraction & saving ----------------- #
-def save_function(path: str, name: str, body: str, start_line: int, repo_root: Optional[str] = None):
+def load_functions() -> Dict[str, dict]:
     file_path: str = "functions.json"
     json_path = Path(file_path)
     if json_path.exists():
         try:
+            if orjson is not None:
+                return orjson.loads(json_path.read_bytes())
             with json_path.open("r") as f:
-                data = json.load(f)
-        except json.JSONDecodeError:
-            data = {}
-    else:
-        data = {}
+                return json.load(f)
+        except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses it
+            return {}
+    return {}
+
 
+def save_function(data: Dict[str, dict], path: str, name: str, body: str, start_line: int, repo_root: Optional[str] = None):
     rel = path
     if repo_root:
         try:
@@ -208,170 +365,209 @@ def save_function(path: str, name: str, body: str, start_line: int, repo_root: O
         "file_path": path  # Also save absolute path for easier matching
     }
 
-    with json_path.open("w") as f:
-        json.dump(data, f, indent=2)
 
+def save_functions(data: Dict[str, dict]):
+    write_json("functions.json", data)
 
-def parse_imports(path: str) -> Dict[str, str]:
+
+def parse_imports(tree: ast.Module) -> Dict[str, str]:
     import_map = {}
-    text = Path(path).read_text().splitlines()
-    for line in text:
-        line = line.strip()
-        if line.startswith("import "):
-            parts = line.replace("import ", "").split(" as ")
-            module = parts[0].strip()
-            alias = parts[1].strip() if len(parts) > 1 else module.split(".")[-1]
-            import_map[alias] = module
-        elif line.startswith("from "):
-            m = re.match(r"from\s+([\w\.]+)\s+import\s+([\w\,\s]+)", line)
-            if m:
-                mod = m.group(1)
-                names = m.group(2).split(",")
-                for n in names:
-                    n = n.strip()
-                    if " as " in n:
-                        real, alias = n.split(" as ")
-                        import_map[alias.strip()] = f"{mod}.{real.strip()}"
-                    else:
-                        import_map[n] = f"{mod}.{n}"
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for a in node.names:
+                import_map[a.asname or a.name.split(".")[-1]] = a.name
+        elif isinstance(node, ast.ImportFrom):
+            mod = "." * node.level + (node.module or "")
+            for a in node.names:
+                if a.name == "*":
+                    continue
+                import_map[a.asname or a.name] = f"{mod}.{a.name}"
     return import_map
 
 
-def qualify_calls_in_line(
-    line: str,
+@lru_cache(maxsize=None)
+def _module_file(module_str: str, current_pkg: str) -> str:
+    """Map an import binding (e.g. pkg.mod.fn or .mod.fn) to /path/to/mod.py."""
+    if module_str.startswith("."):
+        rel_module_path = module_str.lstrip(".")
+        parts = rel_module_path.split(".")
+        file_name = parts[0]
+        rel_module_path = file_name+".py"
+        full_module_path = Path(current_pkg) / rel_module_path
+    else:
+        parts = module_str.split(".")
+        module_path = "/".join(parts[:-1])
+        full_module_path = Path(f"{module_path}.py")
+    return "/" + full_module_path.as_posix()
+
+
+def qualify_name(
+    fn: str,
     imports_map: Dict[str, str],
     local_funcs: set,
-    current_file: str,
-    repo_root: str
+    current_rel: str,
+    current_pkg: str
 ) -> str:
-    def replacer(match):
-        fn = match.group(0).rstrip("(").strip()
-        if fn in local_funcs:
-            rel_path_str = "/" + os.path.relpath(current_file, repo_root).replace("\\", "/")
-            return f"{rel_path_str}::{fn}("
-        elif fn in imports_map:
-            module_str = imports_map[fn]
-            current_file_pkg = Path(current_file).parent.relative_to(repo_root).as_posix()
-            if module_str.startswith("."):
-                rel_module_path = module_str.lstrip(".")
-                parts = rel_module_path.split(".")
-                file_name = parts[0]
-                rel_module_path = file_name+".py"
-                full_module_path = Path(current_file_pkg) / rel_module_path
-            else:
-                parts = module_str.split(".")
-                func_name = parts[-1]
-                module_path = "/".join(parts[:-1])
-                full_module_path = Path(f"{module_path}.py")
-            rel_path_str = "/" + full_module_path.as_posix()
-            return f"{rel_path_str}::{fn}("
-        else:
-            return fn + "("
-    return re.sub(r"\b[A-Za-z_]\w*\s*\(", replacer, line)
+    """
+    Return /path/to/file.py::fn for a known call target, otherwise fn unchanged.
+    current_rel is the calling file as /rel/path.py, current_pkg its directory.
+    """
+    if fn in local_funcs:
+        return f"{current_rel}::{fn}"
+    elif fn in imports_map:
+        return f"{_module_file(imports_map[fn], current_pkg)}::{fn}"
+    return fn
 
 
-def extract_functions_from_file(path: str, function_names: set, repo_root: Optional[str] = None):
-    text = Path(path).read_text().splitlines()
-    results = {}
-    current_name = None
-    current_body = []
-    current_start_line = 0
-    imports_map = parse_imports(path)
-    local_funcs = set()
-    for i, line in enumerate(text):
-        lineno = i + 1
-        m = PY_FUNC_DEF.match(line)
+class _CallSiteCollector(ast.NodeVisitor):
+    """Collect Call.func nodes and (nested) defs under a node without descending into leaves."""
+
+    def __init__(self):
+        self.funcs: List[ast.expr] = []
+        self.defs: List[ast.AST] = []
+
+    def visit_Call(self, node: ast.Call):
+        self.funcs.append(node.func)
+        self.generic_visit(node)
+
+    def visit_FunctionDef(self, node: ast.AST):
+        self.defs.append(node)
+        self.generic_visit(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Name(self, node: ast.Name):
+        pass
+
+    def visit_Constant(self, node: ast.Constant):
+        pass
+
+
+def qualify_calls_in_function(
+    node: ast.AST,
+    body: List[bytes],
+    imports_map: Dict[str, str],
+    local_funcs: set,
+    current_file: str,
+    repo_root: str
+) -> Tuple[str, List[str]]:
+    """
+    Return the source of a function with call targets (and def names) qualified,
+    plus the qualified ids spliced in (its own def name included), in source order.
+    body holds the node's own lines (node.lineno..node.end_lineno) as UTF-8 bytes,
+    since AST columns are byte offsets.
+    Sites come from the AST, so names inside strings and comments are left alone.
+    """
+    current_rel = "/" + os.path.relpath(current_file, repo_root).replace("\\", "/")
+    current_pkg = current_rel[1:].rpartition("/")[0]
+    first = node.lineno
+    body = list(body)
+    collector = _CallSiteCollector()
+    collector.visit(node)
+    sites = []
+    for f in collector.funcs:
+        if isinstance(f, ast.Name):
+            sites.append((f.lineno, f.col_offset, f.end_col_offset, f.id))
+        elif isinstance(f, ast.Attribute):
+            sites.append((f.end_lineno, f.end_col_offset - len(f.attr), f.end_col_offset, f.attr))
+    for n in collector.defs:
+        m = DEF_NAME_RE.match(body[n.lineno - first])
         if m:
-            name = m.group(1)
-            if current_name and current_body:
-                full_body = "\n".join([qualify_calls_in_line(l, imports_map, local_funcs, path, repo_root) for l in current_body])
-                key = make_full_id(path, current_name)
-                results[key] = full_body
-                save_function(path, current_name, full_body, current_start_line, repo_root)
-            current_name = name if name in function_names else None
-            if current_name:
-                local_funcs.add(current_name)
-                current_start_line = lineno
-            current_body = [line] if current_name else []
-        elif current_name:
-            current_body.append(line)
-    if current_name and current_body:
-        full_body = "\n".join([qualify_calls_in_line(l, imports_map, local_funcs, path, repo_root) for l in current_body])
-        key = make_full_id(path, current_name)
-        results[key] = full_body
-        save_function(path, current_name, full_body, current_start_line, repo_root)
-    return results
+            sites.append((n.lineno, m.end(), m.end() + len(n.name.encode()), n.name))
 
+    # resolve each distinct name once
+    qualified = {
+        fn: qualify_name(fn, imports_map, local_funcs, current_rel, current_pkg).encode()
+        for fn in {site[3] for site in sites}
+    }
 
-# ----------------- AST helpers to find calls ----------------- #
-def find_calls_ast(body: str) -> List[str]:
-    found = set()
+    # splice from the end so earlier offsets on the same line stay valid
+    calls = []
+    for lineno, start_col, end_col, fn in sorted(sites, reverse=True):
+        i = lineno - first
+        if i < 0:
+            continue  # decorator line above the def
+        line = body[i]
+        name = fn.encode()
+        if line[start_col:end_col] != name:
+            continue
+        if qualified[fn] != name:
+            body[i] = line[:start_col] + qualified[fn] + line[end_col:]
+            calls.append(qualified[fn].decode())
+    calls.reverse()
+    return b"\n".join(body).decode(), calls
+
+
+def extract_functions_from_file(
+    path: str,
+    function_names: set,
+    repo_root: Optional[str] = None,
+    functions_data: Optional[Dict[str, dict]] = None
+):
     try:
-        node = ast.parse(body)
+        _, tree, imports_map = _load_ast(path)
     except SyntaxError:
-        return list(found)
-    for n in ast.walk(node):
-        if isinstance(n, ast.Call):
-            if isinstance(n.func, ast.Name):
-                found.add(n.func.id)
-            elif isinstance(n.func, ast.Attribute):
-                found.add(n.func.attr)
-    return list(found)
-
-
-# ----------------- Repo index ----------------- #
-def build_repo_index(repo_root: str) -> Dict[str, List[str]]:
-    index: Dict[str, List[str]] = {}
-    for root, dirs, files in os.walk(repo_root):
-        if ".git" in dirs:
-            dirs.remove(".git")
-        for fname in files:
-            if not fname.endswith(".py"):
-                continue
-            fpath = os.path.join(root, fname)
-            if "/.venv/" in fpath or "/venv/" in fpath or "\\.venv\\" in fpath or "\\venv\\" in fpath:
-                continue
-            rel = os.path.relpath(fpath, repo_root).replace("\\", "/")
-            try:
-                src = Path(fpath).read_text()
-                tree = ast.parse(src)
-            except Exception:
-                continue
-            for node in tree.body:
-                if isinstance(node, ast.FunctionDef):
-                    index.setdefault(node.name, []).append(rel)
-    return index
-
-
-# ----------------- Resolution ----------------- #
-def resolve_call(
-    fn_name: str,
-    bindings: Dict[str, str],
-    current_file_abs: str,
-    repo_root: str,
-    repo_index: Dict[str, List[str]],
-) -> str:
-    if fn_name in bindings:
-        mod = bindings[fn_name]
-        mod_path = mod.replace(".", "/") + ".py"
-        abs_mod_path = os.path.join(repo_root, mod_path)
-        if os.path.isfile(abs_mod_path):
-            rel = "/" + os.path.relpath(abs_mod_path, repo_root).replace("\\", "/")
-            return f"{rel}::{fn_name}"
-        return fn_name
-    try:
-        src = Path(current_file_abs).read_text()
-        tree = ast.parse(src)
-        for node in tree.body:
-            if isinstance(node, ast.FunctionDef) and node.name == fn_name:
-                rel = "/" + os.path.relpath(current_file_abs, repo_root).replace("\\", "/")
-                return f"{rel}::{fn_name}"
-    except Exception:
-        pass
-    candidates = repo_index.get(fn_name, [])
-    if len(candidates) == 1:
-        return make_full_id(candidates[0], fn_name)
-    return fn_name
+        return {}
+    # split on b"\n" only, like the tokenizer: str.splitlines() also breaks on
+    # form feeds, \x1c-\x1e, \x85 and \u2028/9, which shifts every later line number
+    lines = _read_bytes(path).split(b"\n")
+    results = {}
+    nodes = sorted(
+        (
+            n for n in ast.walk(tree)
+            if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and n.name in function_names
+        ),
+        key=lambda n: n.lineno,
+    )
+    local_funcs = {n.name for n in nodes}
+    for node in nodes:
+        body = lines[node.lineno - 1:node.end_lineno]
+        full_body, calls = qualify_calls_in_function(node, body, imports_map, local_funcs, path, repo_root)
+        key = make_full_id(path, node.name)
+        results[key] = calls
+        if functions_data is not None:
+            save_function(functions_data, path, node.name, full_body, node.lineno, repo_root)
+    return results
+
+
+PARALLEL_EXTRACT_MIN_FILES = 32
+
+
+def _extract_worker(job: Tuple[str, List[Tuple[int, int]], str]) -> Tuple[Dict[str, List[str]], Dict[str, dict]]:
+    """
+    Find and extract one file's changed functions; returns (qualified calls, functions.json records).
+    Safe to run in a process pool: the file is parsed once, inside the worker.
+    """
+    abs_file, ranges, repo_root = job
+    funcs = changed_functions_in_file(abs_file, ranges)
+    if not funcs:
+        return {}, {}
+    records: Dict[str, dict] = {}
+    extracted = extract_functions_from_file(abs_file, funcs, repo_root=repo_root, functions_data=records)
+    return extracted, records
+
+
+# ----------------- per-file source & AST cache ----------------- #
+@lru_cache(maxsize=None)
+def _read_text(path: str) -> str:
+    return Path(path).read_text()
+
+
+@lru_cache(maxsize=None)
+def _read_bytes(path: str) -> bytes:
+    """The decoded source re-encoded as UTF-8, which is what AST column offsets index into."""
+    return _read_text(path).encode()
+
+
+@lru_cache(maxsize=None)
+def _load_ast(path: str) -> Tuple[str, ast.Module, Dict[str, str]]:
+    """
+    Read and parse a file once per run.
+    Returns (source, tree, imports map).
+    """
+    src = _read_text(path)
+    tree = ast.parse(src)
+    return src, tree, parse_imports(tree)
 
 
 # ----------------- Graph builders ----------------- #
@@ -385,25 +581,13 @@ def normalize_path(path: str, repo_root: str) -> str:
     return "/" + rel_path.replace("\\", "/")  # Ensure Unix-style separators
 
 
-def extract_calls_from_body(body: str, current_fn: str) -> List[str]:
-    """
-    Extract all function calls in the form /path/to/file.py::function_name(...)
-    but ignore the function's own def line.
-    """
-    pattern = r"(/[^:]+\.py::[a-zA-Z0-9_]+)\("
-    calls = re.findall(pattern, body)
-    # Remove self-call from def line
-    return [c for c in calls if c != current_fn]
-
-def build_call_graph(functions: Dict[str, str]) -> Dict[str, List[str]]:
-    """Build call graph from function bodies"""
+def build_call_graph(functions: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Build call graph from each function's qualified call sites"""
     graph = {}
     all_funcs = set(functions.keys())
-    for fn, body in functions.items():
-        calls = extract_calls_from_body(body, fn)
-        # Only keep calls to functions that exist in our set
-        calls = [c for c in calls if c in all_funcs]
-        graph[fn] = calls
+    for fn, calls in functions.items():
+        # Only keep calls to other functions that exist in our set (drops the def name itself)
+        graph[fn] = [c for c in calls if c != fn and c in all_funcs]
     return graph
 
 def find_parents(graph: Dict[str, List[str]]) -> List[str]:
@@ -415,17 +599,11 @@ def find_parents(graph: Dict[str, List[str]]) -> List[str]:
     return list(all_funcs - called_funcs)
 
 def save_graph(graph: Dict[str, List[str]]):
-    file_path = "call_graph.json"
-    path = Path(file_path)
-    with path.open("w") as f:
-        json.dump(graph, f, indent=2)
+    write_json("call_graph.json", graph)
 
 
 def save_parent_functions(parents: List[str]):
-    file_path = "parent_functions.json"
-    path = Path(file_path)
-    with path.open("w") as f:
-        json.dump(parents, f, indent=2)
+    write_json("parent_functions.json", parents)
 
 
 # ----------------- main ----------------- #
@@ -435,25 +613,32 @@ def main(argv: Optional[List[str]] = None):
     args = p.parse_args(argv)
     repo_root = os.path.abspath(args.repo)
     try:
-        res = run_git_diff(repo_root)
-        parsed = parse_diff(res[1])
-        changed_funcs = find_changed_functions(parsed)
-        if not changed_funcs:
-            print(json.dumps({"parents": []}, indent=2))
+        parsed = get_diff_files(repo_root)
+        jobs = [
+            (os.path.join(repo_root, rel_file), ranges, repo_root)
+            for rel_file, ranges in changed_file_ranges(parsed)
+        ]
+        if len(jobs) >= PARALLEL_EXTRACT_MIN_FILES:
+            with ProcessPoolExecutor() as ex:
+                results = [r for r in ex.map(_extract_worker, jobs) if r[0]]
+        else:
+            results = [r for r in map(_extract_worker, jobs) if r[0]]
+        if not results:
+            print_json({"parents": []})
             return
-        repo_index = build_repo_index(repo_root)
-        all_func_bodies: Dict[str, str] = {}
-        for rel_file, funcs in changed_funcs.items():
-            abs_file = os.path.join(repo_root, rel_file)
-            extracted = extract_functions_from_file(abs_file, funcs, repo_root=repo_root)
-            for full_id, body in extracted.items():
+        functions_data = load_functions()
+        all_func_calls: Dict[str, List[str]] = {}
+        for extracted, records in results:
+            functions_data.update(records)
+            for full_id, calls in extracted.items():
                 key = "/"+ rel_path(repo_root, full_id)
-                all_func_bodies[key] = body
-        call_graph = build_call_graph(all_func_bodies)
+                all_func_calls[key] = calls
+        save_functions(functions_data)
+        call_graph = build_call_graph(all_func_calls)
         save_graph(call_graph)
         parents = find_parents(call_graph)
         save_parent_functions(parents)
-        print(json.dumps({"parents": parents}, indent=2), file=sys.stdout)
+        print_json({"parents": parents})
     except Exception as e:
         raise e
 
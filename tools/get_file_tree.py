@@ -1,8 +1,14 @@
 import os
+import sys
 import json
 import subprocess
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used when orjson is missing
+    orjson = None
+
 GIT_STATUS_CODES = {
     "A": "added",
     "M": "modified",
@@ -25,25 +31,46 @@ def git_status(path: Path):
     except Exception:
         return {}
 
+def _hidden(name: str) -> bool:
+    return name.startswith(".") or name.startswith("__pycache__")
+
 def build_tree(path: Path, git_status_dict):
+    """
+    Build the nested tree in a single os.walk pass (no per-directory recursion).
+    Hidden and __pycache__ dirs are pruned in place; each directory's children are
+    filled in when the walk reaches it, folders first, then files, by lowercase name.
+    """
+    root = str(path)
+    rel_root = os.path.relpath(path, start=repo_root)
     node = {
         "name": path.name,
-        "path": str(path),
+        "path": root,
         "type": "folder" if path.is_dir() else "file",
         "git": None
     }
+    if not path.is_dir():
+        if path.is_file():
+            node["git"] = git_status_dict.get(rel_root)
+        return node
 
-    if path.is_file():
-        rel_path = os.path.relpath(path, start=repo_root)
-        node["git"] = git_status_dict.get(rel_path)
-
-    if path.is_dir():
-        children = []
-        for p in sorted(path.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
-            if p.name.startswith(".") or p.name.startswith("__pycache__"):
-                continue
-            children.append(build_tree(p, git_status_dict))
-        node["children"] = children
+    node["children"] = []
+    pending = {root: (node, "" if rel_root == "." else rel_root)}
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        parent, parent_rel = pending.pop(dirpath)
+        children = parent["children"]
+        dirnames[:] = sorted((d for d in dirnames if not _hidden(d)), key=str.lower)
+        for d in dirnames:
+            child_path = os.path.join(dirpath, d)
+            child = {"name": d, "path": child_path, "type": "folder", "git": None, "children": []}
+            children.append(child)
+            pending[child_path] = (child, os.path.join(parent_rel, d))
+        for f in sorted((f for f in filenames if not _hidden(f)), key=str.lower):
+            child_path = os.path.join(dirpath, f)
+            status = git_status_dict.get(os.path.join(parent_rel, f))
+            # non-regular entries (e.g. dangling symlinks) never carry a status
+            if status is not None and not os.path.isfile(child_path):
+                status = None
+            children.append({"name": f, "path": child_path, "type": "file", "git": status})
 
     return node
 
@@ -55,4 +82,11 @@ if __name__ == "__main__":
     repo_root = Path(args.root).resolve()
     git_changes = git_status(repo_root)
     tree = build_tree(repo_root, git_changes)
-    print(json.dumps(tree, indent=2))
+    # indented on a terminal, compact when piped (the app parses it in one go)
+    pretty = sys.stdout.isatty()
+    if orjson is not None:
+        print(orjson.dumps(tree, option=orjson.OPT_INDENT_2 if pretty else 0).decode())
+    elif pretty:
+        print(json.dumps(tree, indent=2))
+    else:
+        print(json.dumps(tree, separators=(",", ":")))
@@ -1,4 +1,5 @@
 import argparse
+import ast
 import sys
 import os
 import json
@@ -6,10 +7,16 @@ import importlib.util
 import types
 import traceback
 import threading
-import bdb
 import inspect
+import functools
+import itertools
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:  # optional: stdlib json is used when orjson is missing
+    orjson = None
+
 # --------------------------
 # Logging Setup
 # --------------------------
@@ -33,6 +40,14 @@ def init_logging():
     log(f"Log file: {LOG_FILE}")
     log("=" * 80)
 
+# Line-buffered handle for debugger_input.log, opened once instead of per input
+_input_log = None
+
+def open_input_log():
+    """Open debugger_input.log (in the working directory) for the stop lines we receive."""
+    global _input_log
+    _input_log = open("debugger_input.log", "a", encoding="utf-8", buffering=1)
+
 def log(message, level="INFO"):
     """Write log message to file with timestamp."""
     if _log_file:
@@ -49,11 +64,64 @@ def log_exception(e, context=""):
 # Helpers
 # --------------------------
 
+# Event values are already reduced to exact JSON types by snapshot_value/safe_json,
+# so orjson needs no default= hook.
+_ORJSON_EVENT_OPTIONS = orjson.OPT_APPEND_NEWLINE if orjson is not None else 0
+
+def encode_event(event_json) -> bytes:
+    """
+    One compact JSON line (newline included). Scalar locals/globals reach here
+    untouched and everything else already bounded by snapshot_value, so the
+    encoder walks each value once.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(event_json, option=_ORJSON_EVENT_OPTIONS)
+        except orjson.JSONEncodeError:  # e.g. ints wider than 64 bits
+            pass
+    return (json.dumps(event_json, separators=(",", ":")) + "\n").encode()
+
+def loads_json(text):
+    """orjson.loads when available; stdlib json for what orjson rejects (NaN, ints wider than 64 bits)."""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
 def send_event(event_json):
     # Only send_event writes to stderr (for Rust communication)
     # All other output goes to log file
-    print(json.dumps(event_json, separators=(",", ":")), flush=True, file=sys.stderr)
-    log(f"Sent event: {json.dumps(event_json, separators=(',', ':'))[:200]}...")  # Log first 200 chars
+    payload = encode_event(event_json)
+    sys.stderr.flush()
+    sys.stderr.buffer.write(payload)
+    sys.stderr.buffer.flush()
+    log(f"Sent event: {payload[:200].decode(errors='replace')}...")  # Log first 200 chars
+
+def read_stop_line():
+    """Next stop line from stdin; None once the client is done (empty line, "0" or EOF)."""
+    while True:
+        log("Waiting for user input (stdin)")
+        # Raw bytes: int() parses b"12" directly, text is only decoded for the logs
+        raw = sys.stdin.buffer.readline().strip()
+        user_input = raw.decode(errors="replace")
+        log(f"Received user input: '{user_input}'")
+        if _input_log:
+            _input_log.write(f"Received input: {user_input}\n")
+        if not raw or raw == b"0":
+            return None
+        try:
+            return int(raw)
+        except ValueError as e:
+            log_exception(e, "read_stop_line")
+
+def exit_tracer(code=0):
+    """Exit right away, even from inside a paused target function."""
+    log("Tracer exiting")
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
 
 
 def import_module_from_path(repo_root: str, rel_path: str):
@@ -67,23 +135,162 @@ def import_module_from_path(repo_root: str, rel_path: str):
     pkg_name = ".".join(mod_name.split(".")[:-1])
     if pkg_name:
         module.__package__ = pkg_name
-    spec.loader.exec_module(module)  # type: ignore
+    # Registered first, like a regular import, so imports of mod_name made while
+    # (or after) it runs get this module instead of executing the file again
+    sys.modules[mod_name] = module
+    try:
+        spec.loader.exec_module(module)  # type: ignore
+    except BaseException:
+        sys.modules.pop(mod_name, None)
+        raise
+    parent = sys.modules.get(pkg_name) if pkg_name else None
+    if parent is not None:
+        setattr(parent, mod_name.rpartition(".")[2], module)
     return module
 
-def safe_json(value):
+# Exact built-in types safe_json settles with one set lookup on type(value);
+# subclasses and everything else take the isinstance chain.
+_JSON_SCALAR_TYPES = frozenset((str, int, float, bool, type(None)))
+_JSON_SEQUENCE_TYPES = frozenset((list, tuple, set))
+_STR_TYPE = frozenset((str,))
+
+# A stop inside a loop snapshots every local again, so big or deeply nested
+# values are cut short instead of being walked in full on each step.
+_MAX_DEPTH = 4  # containers nested deeper than this become "<list truncated>"
+_MAX_ITEMS = 64  # per list/tuple/set/dict; the rest is summarised as "...(N more)"
+
+def safe_json(value, depth=0):
     try:
-        if isinstance(value, (str, int, float, bool, type(None))):
+        t = type(value)
+        if t in _JSON_SCALAR_TYPES:
             return value
+        if t in _JSON_SEQUENCE_TYPES:
+            return _safe_sequence(value, depth)
+        if t is dict:
+            return _safe_dict(value, depth)
+        # Scalar subclasses (str enums, IntEnum, float subclasses, ...)
+        # become their plain value, so the encoders only ever see exact types
+        if isinstance(value, str):
+            return str.__str__(value)
+        if isinstance(value, int):
+            return int.__int__(value)
+        if isinstance(value, float):
+            return float.__float__(value)
         if isinstance(value, (list, tuple, set)):
-            return [safe_json(v) for v in value]
+            return _safe_sequence(value, depth)
         if isinstance(value, dict):
-            return {str(k): safe_json(v) for k, v in value.items()}
+            return _safe_dict(value, depth)
         if isinstance(value, (types.FunctionType, types.ModuleType, type, types.FrameType, types.TracebackType)):
             return f"<{type(value).__name__}>"
         return str(value)
     except Exception:
         return f"<unserializable {type(value).__name__}>"
 
+def _safe_sequence(value, depth):
+    if depth >= _MAX_DEPTH:
+        return f"<{type(value).__name__} truncated>"
+    extra = len(value) - _MAX_ITEMS
+    if extra <= 0:
+        return [safe_json(v, depth + 1) for v in value]
+    items = [safe_json(v, depth + 1) for v in itertools.islice(value, _MAX_ITEMS)]
+    items.append(f"...({extra} more)")
+    return items
+
+def _safe_dict(value, depth):
+    if depth >= _MAX_DEPTH:
+        return f"<{type(value).__name__} truncated>"
+    extra = len(value) - _MAX_ITEMS
+    if extra <= 0:
+        return {str(k): safe_json(v, depth + 1) for k, v in value.items()}
+    items = {str(k): safe_json(v, depth + 1) for k, v in itertools.islice(value.items(), _MAX_ITEMS)}
+    items["..."] = f"({extra} more)"
+    return items
+
+def snapshot_value(value):
+    """A local/global/return value as it goes into an event: scalars as-is, anything else through safe_json."""
+    t = type(value)
+    if t in _JSON_SCALAR_TYPES:
+        return value
+    # Flat containers of scalars within _MAX_ITEMS come out of safe_json
+    # unchanged, so skip the per-item calls: a C-level shallow copy (the return
+    # event is encoded later, after the target has returned) is enough and
+    # orjson encodes it natively.
+    if t is list or t is tuple:
+        if len(value) <= _MAX_ITEMS and _JSON_SCALAR_TYPES.issuperset(map(type, value)):
+            return value if t is tuple else list(value)
+    elif t is dict:
+        if len(value) <= _MAX_ITEMS and _STR_TYPE.issuperset(map(type, value)) \
+                and _JSON_SCALAR_TYPES.issuperset(map(type, value.values())):
+            return dict(value)
+    return safe_json(value)
+
+
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+
+def _module_scope_nodes(tree):
+    """
+    Every node evaluated in module scope, at any nesting depth (if/try/for/with
+    bodies included). Function, class and lambda bodies are their own scopes,
+    so only their decorators, defaults and bases are visited.
+    """
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, _SCOPE_NODES):
+            args = getattr(node, "args", None)
+            if args is not None:
+                stack.extend(args.defaults)
+                stack.extend(d for d in args.kw_defaults if d is not None)
+            stack.extend(getattr(node, "decorator_list", ()))
+            stack.extend(getattr(node, "bases", ()))
+            stack.extend(getattr(node, "keywords", ()))
+        else:
+            stack.extend(ast.iter_child_nodes(node))
+
+def _binds(node, name):
+    """True if a module-scope node (re)binds or deletes `name`; `import *` counts, since it may."""
+    if isinstance(node, ast.Name):
+        return node.id == name and not isinstance(node.ctx, ast.Load)
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return node.name == name
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return any(a.name == "*" or (a.asname or a.name).split(".")[0] == name for a in node.names)
+    if isinstance(node, ast.alias):  # judged with its Import above
+        return False
+    # except ... as name, match-case captures (MatchAs/MatchStar name, MatchMapping rest)
+    return getattr(node, "name", None) == name or getattr(node, "rest", None) == name
+
+def _signature_from_source(abs_path: str, fn_name: str):
+    """
+    Parameter names of a top-level def, read from the AST without running the
+    module. None when only an import can tell: the name has no top-level def,
+    the def is decorated (decorators may change the signature), or the name is
+    bound anywhere else in module scope.
+    """
+    with open(abs_path, "rb") as f:
+        tree = ast.parse(f.read(), abs_path)
+    node = None
+    for stmt in tree.body:
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)) and stmt.name == fn_name:
+            node = stmt
+    if node is None or node.decorator_list:
+        return None
+    # Any other binding of the name (tuple targets, assignments inside if/try/for,
+    # imports, a second def, `global fn_name` in a function) may be the one that
+    # wins at import time, so leave those to the import
+    if any(n is not node and _binds(n, fn_name) for n in _module_scope_nodes(tree)):
+        return None
+    if any(isinstance(n, (ast.Global, ast.Nonlocal)) and fn_name in n.names for n in ast.walk(tree)):
+        return None
+    a = node.args
+    params = [p.arg for p in a.posonlyargs + a.args]
+    if a.vararg:
+        params.append(a.vararg.arg)
+    params += [p.arg for p in a.kwonlyargs]
+    if a.kwarg:
+        params.append(a.kwarg.arg)
+    return params
 
 def get_function_signature(repo_root: str, entry_full_id: str):
     """Get the function signature (parameter names) for a given function."""
@@ -95,7 +302,16 @@ def get_function_signature(repo_root: str, entry_full_id: str):
         
         rel_path, fn_name = entry_full_id.split("::", 1)
         log(f"Parsing entry_full_id: rel_path={rel_path}, fn_name={fn_name}")
-        
+
+        params = _signature_from_source(os.path.join(repo_root, rel_path.lstrip("/")), fn_name)
+        if params is not None:
+            log(f"Function signature from source: params={params}, param_count={len(params)}")
+            return {
+                "params": params,
+                "param_count": len(params)
+            }
+        log("Signature not readable from source, importing module")
+
         module = import_module_from_path(repo_root, rel_path)
         log(f"Module imported: {module}")
         
@@ -118,152 +334,277 @@ def get_function_signature(repo_root: str, entry_full_id: str):
         log_exception(e, "get_function_signature")
         return {"error": str(e)}
 
+# Imported modules, functions and classes aren't variables
+_NON_VARIABLE_TYPES = (types.ModuleType, types.FunctionType, type)
+
+def _is_user_global(k, v):
+    """True for module globals the user declared as variables (not imports, functions, classes or typing constructs)."""
+    # Skip built-in names and system variables (__builtins__, __file__, __name__, ...)
+    if k.startswith('__') and k.endswith('__'):
+        return False
+
+    if isinstance(v, _NON_VARIABLE_TYPES):
+        return False
+
+    # Skip typing constructs (Dict, List[int], Optional, TypeVar, ...); their
+    # types live in the typing module, so no per-value __module__ lookup is needed
+    if type(v).__module__ == 'typing':
+        return False
+
+    # Only include simple variable types: int, str, float, bool, None, list, dict, tuple, set
+    # These are the actual variable values the user declared
+    return True
+
+# Bound once for the sys.monitoring callbacks, which run for every traced line
+_get_ident = threading.get_ident
+_getframe = sys._getframe
+
+@functools.lru_cache(maxsize=None)
+def _offset_line(code, offset):
+    """Source line of the instruction at a bytecode offset (None if it has none)."""
+    for start, end, line in code.co_lines():
+        if start <= offset < end:
+            return line
+    return None
+
 # --------------------------
 # Persistent Debugger
 # --------------------------
-class PersistentDebugger(bdb.Bdb):
+class PersistentDebugger:
+    """
+    Line tracer for the thread that runs the target function.
+
+    On Python 3.12+ it uses sys.monitoring (PEP 669): PY_START fires once per code
+    object, and only code objects from target_file get LINE/JUMP/PY_RETURN/PY_YIELD
+    events switched on locally, so every other code runs uninstrumented.
+    Older interpreters (or another debugger holding the tool id) fall back to
+    sys.settrace, whose global trace function only hands a local trace function
+    to frames from target_file.
+    """
     def __init__(self):
-        super().__init__()
-        self.step_event = threading.Event()  # allows debugger thread to proceed
-        self.ready_event = threading.Event()  # signals main that last_event is ready
         self.target_line = None
         self.last_event = None
-        self.running_thread = None
+        self._global_keys = None  # user_global_keys cache, dropped on every call and return
+        self._global_keys_of = None
+        self._global_count = 0
         self.target_file = None
-        self.thread_exception = None  # Store exceptions from the debugger thread
-
-    def user_line(self, frame):
-        lineno = frame.f_lineno
-        fname = os.path.abspath(frame.f_code.co_filename)
-        log(f"user_line called: line {lineno} in {fname}")
-        # Only stop for the main target file
-        if fname != self.target_file:
-            log(f"Skipping line {lineno} (not in target file {self.target_file})")
+        self._send_lock = threading.Lock()  # the start-up watchdog may race the first send
+        self._watchdog = None
+        self._abs_filenames = {}  # co_filename -> interned absolute path
+        self._monitoring = None  # sys.monitoring while it is in use, else None
+        self._monitored_codes = set()
+        self._traced_thread = None
+
+    def is_target_code(self, code):
+        # abspath (getcwd + normpath) runs once per distinct co_filename, not per call
+        fname = self._abs_filenames.get(code.co_filename)
+        if fname is None:
+            fname = self._abs_filenames[code.co_filename] = sys.intern(os.path.abspath(code.co_filename))
+        return fname == self.target_file
+
+    def trace_dispatch(self, frame, event, arg):
+        # Global trace function: only called for "call" events. Returning None
+        # leaves the new frame without line/return tracing.
+        if not self.is_target_code(frame.f_code):
+            return None
+        self._global_keys = None
+        return self.trace_frame
+
+    def trace_frame(self, frame, event, arg):
+        if event == "line":
+            self.user_line(frame)
+        elif event == "return":
+            self.user_return(frame, arg)
+        return self.trace_frame
+
+    def start_tracing(self):
+        """Start tracing the calling thread."""
+        mon = getattr(sys, "monitoring", None)
+        if mon is not None:
+            try:
+                mon.use_tool_id(mon.DEBUGGER_ID, "linearizer")
+            except ValueError:  # the id is held by another debugger
+                mon = None
+        if mon is None:
+            sys.settrace(self.trace_dispatch)
             return
-
-        funcname = frame.f_code.co_name
-        locals_snapshot = {k: safe_json(v) for k, v in frame.f_locals.items()}
-        
+        self._monitoring = mon
+        self._traced_thread = threading.get_ident()
+        events = mon.events
+        mon.register_callback(mon.DEBUGGER_ID, events.PY_START, self.monitor_start)
+        mon.register_callback(mon.DEBUGGER_ID, events.LINE, self.monitor_line)
+        mon.register_callback(mon.DEBUGGER_ID, events.JUMP, self.monitor_jump)
+        mon.register_callback(mon.DEBUGGER_ID, events.PY_RETURN, self.monitor_return)
+        mon.register_callback(mon.DEBUGGER_ID, events.PY_YIELD, self.monitor_return)
+        mon.set_events(mon.DEBUGGER_ID, events.PY_START)
+
+    def stop_tracing(self):
+        mon = self._monitoring
+        if mon is None:
+            sys.settrace(None)
+            return
+        events = mon.events
+        mon.set_events(mon.DEBUGGER_ID, 0)
+        for code in self._monitored_codes:
+            mon.set_local_events(mon.DEBUGGER_ID, code, 0)
+        self._monitored_codes.clear()
+        for event in (events.PY_START, events.LINE, events.JUMP, events.PY_RETURN, events.PY_YIELD):
+            mon.register_callback(mon.DEBUGGER_ID, event, None)
+        mon.free_tool_id(mon.DEBUGGER_ID)
+        mon.restart_events()
+        self._monitoring = None
+
+    def monitor_start(self, code, instruction_offset):
+        # Decided once per code object: DISABLE turns PY_START off for it afterwards
+        mon = self._monitoring
+        if self.is_target_code(code):
+            events = mon.events
+            mon.set_local_events(
+                mon.DEBUGGER_ID, code, events.LINE | events.JUMP | events.PY_RETURN | events.PY_YIELD
+            )
+            self._monitored_codes.add(code)
+        return mon.DISABLE
+
+    def monitor_line(self, code, line_number):
+        # monitoring is process-wide; like settrace, only the runner thread is traced
+        if _get_ident() == self._traced_thread:
+            self.user_line(_getframe(1))
+
+    def monitor_jump(self, code, instruction_offset, destination_offset):
+        # settrace reports a backward jump that stays on the same line (one-line
+        # loops, comprehensions) as a new line event; LINE does not, so replay it
+        if destination_offset > instruction_offset:
+            return self._monitoring.DISABLE  # forward jumps never qualify
+        if _get_ident() != self._traced_thread:
+            return None
+        if _offset_line(code, destination_offset) == _offset_line(code, instruction_offset):
+            self.user_line(_getframe(1))
+        return None
+
+    def monitor_return(self, code, instruction_offset, retval):
+        if _get_ident() == self._traced_thread:
+            self.user_return(_getframe(1), retval)
+
+    def user_global_keys(self, f_globals):
+        # The filter runs once per call/return (or when a global is added or
+        # removed), not on every line; values are re-read on each snapshot.
+        if self._global_keys is None or self._global_keys_of is not f_globals or len(f_globals) != self._global_count:
+            self._global_keys = [k for k, v in f_globals.items() if _is_user_global(k, v)]
+            self._global_keys_of = f_globals
+            self._global_count = len(f_globals)
+        return self._global_keys
+
+    def snapshot_globals(self, f_globals):
         # Capture only user-declared globals from the current file
-        globals_snapshot = {}
-        builtin_names = {'__builtins__', '__file__', '__name__', '__doc__', '__package__', 
-                        '__loader__', '__spec__', '__cached__', '__annotations__'}
-        
-        for k, v in frame.f_globals.items():
-            # Skip built-in names and system variables
-            if k in builtin_names or (k.startswith('__') and k.endswith('__')):
-                continue
-            
-            # Skip imported modules
-            if isinstance(v, types.ModuleType):
-                continue
-            
-            # Skip functions (only want variables)
-            if isinstance(v, types.FunctionType):
-                continue
-            
-            # Skip classes (only want variables)
-            if isinstance(v, type):
-                continue
-            
-            # Skip typing constructs (Dict, List, Optional, etc. from typing module)
-            if hasattr(v, '__module__') and v.__module__ == 'typing':
-                continue
-            
-            # Skip typing._GenericAlias and similar typing constructs
-            if type(v).__module__ == 'typing':
-                continue
-            
-            # Only include simple variable types: int, str, float, bool, None, list, dict, tuple, set
-            # These are the actual variable values the user declared
-            globals_snapshot[k] = safe_json(v)
-
-        self.last_event = {
+        return {k: f_globals[k] for k in self.user_global_keys(f_globals) if k in f_globals}
+
+    def build_line_event(self, fname, funcname, lineno, f_locals, globals_snapshot):
+        return {
             "event": "line",
             "filename": fname,
             "function": funcname,
             "line": lineno,
-            "locals": locals_snapshot,
-            "globals": globals_snapshot
+            "locals": {k: snapshot_value(v) for k, v in f_locals.items()},
+            "globals": {k: snapshot_value(v) for k, v in globals_snapshot.items()}
         }
-        log(f"Created line event: {funcname}:{lineno}, target_line={self.target_line}")
-
-        # Stop if we've reached the target line
-        if self.target_line is not None and lineno >= self.target_line:
-            log(f"Reached target line {self.target_line} (current: {lineno}), stopping and waiting")
-            self.set_step()
-            # Notify main thread that we have a fresh event ready
-            self.ready_event.set()
-            log("Set ready_event, waiting for step_event")
-            # Wait until the main thread asks us to continue
-            self.step_event.clear()
-            self.step_event.wait()
-            log("Received step_event, continuing")
-
-    def continue_until(self, line):
-        log(f"continue_until called with line={line}")
+
+    def user_line(self, frame):
+        lineno = frame.f_lineno
+        fname = self.target_file  # only frames from target_file are traced
+        target_line = self.target_line
+
+        # Lines run past on the way to the stop line build no event (and are not
+        # logged: this runs for every traced line). If the function returns
+        # before getting there, user_return reports its state.
+        if target_line is None or lineno < target_line:
+            return
+
+        funcname = frame.f_code.co_name
+        self.last_event = self.build_line_event(
+            fname, funcname, lineno, frame.f_locals, self.snapshot_globals(frame.f_globals)
+        )
+        log(f"Created line event: {funcname}:{lineno} in {fname}, target_line={target_line}")
+
+        # Stop: we've reached the target line
+        log(f"Reached target line {target_line} (current: {lineno}), stopping and waiting")
+        self.pause()
+
+    def pause(self):
+        """
+        Report last_event and block on stdin until the client names the next
+        stop line. This runs inside the trace callback on the thread executing
+        the target, so the target stays paused for free while we wait.
+        """
+        self.send(self.last_event)
+        line = read_stop_line()
+        if line is None:
+            exit_tracer()
+        log(f"Continuing until line {line}")
         self.target_line = line
-        self.ready_event.clear()
-        self.step_event.set()
-        log("Set step_event to continue execution")
 
-    def wait_for_event(self, timeout=None):
-        return self.ready_event.wait(timeout=timeout)
+    def send(self, event):
+        with self._send_lock:
+            if self._watchdog is not None:
+                self._watchdog.cancel()
+                self._watchdog = None
+            send_event(event)
+
+    def start_watchdog(self, timeout):
+        """Send a timeout error if the first event isn't sent within `timeout` seconds."""
+        self._watchdog = threading.Timer(timeout, self._on_timeout, (self.target_line, timeout))
+        self._watchdog.daemon = True
+        self._watchdog.start()
+
+    def _on_timeout(self, line, timeout):
+        with self._send_lock:
+            if self._watchdog is None:  # the first event got there first
+                return
+            log(f"No event after {timeout} seconds - timeout", "ERROR")
+            send_event({
+                "event": "error",
+                "error": f"Timeout waiting for function to reach line {line}",
+                "traceback": "The function may be stuck in an infinite loop or waiting for input."
+            })
+            exit_tracer(1)
+
+    def is_entry_frame(self, frame):
+        """True if no caller of frame comes from the target file, i.e. it is the call the client asked for."""
+        filename = frame.f_code.co_filename
+        caller = frame.f_back
+        while caller is not None:
+            if caller.f_code.co_filename == filename:
+                return False
+            caller = caller.f_back
+        return True
 
     def user_return(self, frame, return_value):
         """Called when a function returns."""
-        # If function completes before reaching target line, create an event
-        if self.target_line is not None and self.last_event is None:
-            # Function completed before we could capture an event
-            # Create a completion event
-            fname = os.path.abspath(frame.f_code.co_filename)
-            if fname == self.target_file:
-                self.last_event = {
-                    "event": "return",
-                    "filename": fname,
-                    "function": frame.f_code.co_name,
-                    "line": frame.f_lineno,
-                    "locals": {k: safe_json(v) for k, v in frame.f_locals.items()},
-                    "return_value": safe_json(return_value)
-                }
-                self.ready_event.set()
+        self._global_keys = None
+        # The function finished before reaching the target line: lines run past
+        # were never snapshotted, so report its state as it returns
+        if self.target_line is not None and self.is_entry_frame(frame):
+            # only frames from target_file are traced
+            self.last_event = {
+                "event": "return",
+                "filename": self.target_file,
+                "function": frame.f_code.co_name,
+                "line": frame.f_lineno,
+                "locals": {k: snapshot_value(v) for k, v in frame.f_locals.items()},
+                "globals": {k: snapshot_value(v) for k, v in self.snapshot_globals(frame.f_globals).items()},
+                "return_value": snapshot_value(return_value)
+            }
 
     def run_function_once(self, fn, args=None, kwargs=None):
+        """Run fn on the calling thread under tracing; exceptions propagate to the caller."""
         args = args or []
         kwargs = kwargs or {}
         log(f"run_function_once called: fn={fn.__name__ if hasattr(fn, '__name__') else str(fn)}, args={args}, kwargs={kwargs}")
-        
-        def run_with_error_handling():
-            try:
-                log("Starting function execution in debugger thread")
-                self.runctx(
-                    "fn(*args, **kwargs)",
-                    globals={"fn": fn, "args": args, "kwargs": kwargs},
-                    locals={}
-                )
-                log("Function execution completed normally")
-                # If we get here, function completed normally
-                # Check if we need to set ready_event (in case function completed before target line)
-                if not self.ready_event.is_set() and self.target_line is not None:
-                    # Function completed but we never reached target line
-                    log("Function completed before reaching target line, setting ready_event")
-                    self.ready_event.set()
-            except Exception as e:
-                # Store the exception
-                log_exception(e, "run_with_error_handling")
-                self.thread_exception = e
-                # Set ready_event so wait_for_event doesn't hang
-                self.ready_event.set()
-                log("Exception occurred, set ready_event and thread_exception")
-                # Do not send event here - let main thread handle it
-                # Do not re-raise here, let the main thread handle it via wait_for_event
-        
-        self.running_thread = threading.Thread(target=run_with_error_handling)
-        self.running_thread.start()
-        log("Started debugger thread")
-        # let the debugger start paused until the first continue_until
-        self.step_event.clear()
-        log("Cleared step_event (debugger paused)")
+        self.start_tracing()
+        try:
+            fn(*args, **kwargs)
+        finally:
+            self.stop_tracing()
+        log("Function execution completed normally")
 
 # --------------------------
 # Main CLI
@@ -326,13 +667,13 @@ def main():
     log(f"  stop_line: {stop_line}")
     log(f"  args_json: {args_json}")
 
-    with open("debugger_input.log", "a") as f:
-        f.write(f"{stop_line}\n")
+    open_input_log()
+    _input_log.write(f"{stop_line}\n")
     args_list = []
     kwargs_dict = {}
     if args_json:
         try:
-            parsed = json.loads(args_json)
+            parsed = loads_json(args_json)
             args_list = parsed.get("args", [])
             kwargs_dict = parsed.get("kwargs", {})
         except Exception:
@@ -346,16 +687,25 @@ def main():
     abs_path = os.path.join(repo_root, rel_path.lstrip("/"))
     log(f"Parsed entry_full_id: rel_path={rel_path}, fn_name={fn_name}, abs_path={abs_path}")
 
-    if not os.path.isfile(abs_path):
-        error_msg = {"error": "file not found", "file": abs_path}
-        log(f"ERROR: {error_msg}", "ERROR")
-        print(json.dumps(error_msg))
-        sys.exit(1)
-
     try:
         log(f"Importing module from path: {rel_path}")
         mod = import_module_from_path(repo_root, rel_path)
         log(f"Module imported successfully: {mod}")
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError) as e:
+        # The import's own stat/read of abs_path doubles as the existence check;
+        # the same errors raised by the module's top-level code are import failures
+        if e.filename != abs_path:
+            error_msg = {
+                "error": "module import failed",
+                "exception": str(e),
+                "traceback": traceback.format_exc()
+            }
+            log_exception(e, "import_module_from_path")
+        else:
+            error_msg = {"error": "file not found", "file": abs_path}
+            log(f"ERROR: {error_msg}", "ERROR")
+        print(json.dumps(error_msg))
+        sys.exit(1)
     except Exception as e:
         error_msg = {
             "error": "module import failed",
@@ -376,104 +726,40 @@ def main():
     log(f"Found function: {fn_name}, callable={callable(fn)}")
 
     dbg = PersistentDebugger()
-    dbg.target_file = abs_path  # Only this file counts for stop_line
+    dbg.target_file = sys.intern(abs_path)  # Only this file counts for stop_line
     dbg.repo_root = repo_root
     log(f"Created PersistentDebugger, target_file={abs_path}")
 
-    log(f"Starting function execution with args={args_list}, kwargs={kwargs_dict}")
-    dbg.run_function_once(fn, args_list, kwargs_dict)
-
-    # Run until initial stop_line
-    log(f"Continuing until stop_line={stop_line}")
-    dbg.continue_until(stop_line)
-    
-    # Wait for event with timeout to detect if thread died
-    log("Waiting for event (timeout=30.0s)")
-    if not dbg.wait_for_event(timeout=30.0):
-        log("wait_for_event timed out after 30 seconds", "WARNING")
-        # Check if thread is still alive
-        thread_alive = dbg.running_thread.is_alive()
-        log(f"Thread alive status: {thread_alive}")
-        if not thread_alive:
-            # Thread died, check if there's an exception stored
-            log("Thread died, checking for exception", "ERROR")
-            if dbg.thread_exception:
-                log_exception(dbg.thread_exception, "thread execution")
-                error_event = {
-                    "event": "error",
-                    "error": str(dbg.thread_exception),
-                    "traceback": traceback.format_exc()
-                }
-            else:
-                error_event = {
-                    "event": "error",
-                    "error": "Function execution thread died before reaching target line",
-                    "traceback": "The function may have raised an exception or exited unexpectedly."
-                }
-            log(f"Sending error event: {error_event['error']}", "ERROR")
-            send_event(error_event)
-            sys.exit(1)
-        else:
-            # Thread alive but no event - timeout
-            log("Thread alive but no event received - timeout", "ERROR")
-            error_event = {
-                "event": "error",
-                "error": f"Timeout waiting for function to reach line {stop_line}",
-                "traceback": "The function may be stuck in an infinite loop or waiting for input."
-            }
-            send_event(error_event)
-            sys.exit(1)
-    
-    log("Event received, checking for exception or event")
-    # Check if there's a stored exception
-    if dbg.thread_exception:
-        log_exception(dbg.thread_exception, "function execution")
-        error_event = {
+    log(f"Starting function execution with args={args_list}, kwargs={kwargs_dict}, stop_line={stop_line}")
+    dbg.target_line = stop_line
+    dbg.start_watchdog(30.0)
+    try:
+        dbg.run_function_once(fn, args_list, kwargs_dict)
+        final_event = dbg.last_event
+    except Exception as e:
+        log_exception(e, "function execution")
+        # An error even after a stop: there is no event for the lines run past to fall back on
+        final_event = {
             "event": "error",
-            "error": str(dbg.thread_exception),
+            "error": str(e),
             "traceback": traceback.format_exc()
         }
-        log("Sending error event from thread_exception", "ERROR")
-        send_event(error_event)
-    elif dbg.last_event:
-        # Send the event (could be regular event or error event from exception handler)
-        log(f"Sending last_event: {dbg.last_event.get('event', 'unknown')} at line {dbg.last_event.get('line', 'unknown')}")
-        send_event(dbg.last_event)
-    else:
-        # No event was set - this shouldn't happen but send an error
+    if not final_event:
         log("WARNING: No event was generated", "WARNING")
-        error_event = {
+        final_event = {
             "event": "error",
             "error": f"No event was generated when reaching line {stop_line}",
             "traceback": "The debugger may not have stopped at the expected line. The function may have completed before reaching the target line."
         }
-        send_event(error_event)
 
-    # Interactive stepping
-    log("Entering interactive stepping loop")
+    # The function has finished: answer the pending request, and any later ones,
+    # with its final state.
     while True:
-        try:
-            log("Waiting for user input (stdin)")
-            user_input = input().strip()
-            log(f"Received user input: '{user_input}'")
-            with open("debugger_input.log", "a") as f:
-                f.write(f"Received input: {user_input}\n")
-
-            if not user_input or user_input == "0":
-                log("User input is empty or '0', breaking loop")
-                break
-            line = int(user_input)
-            log(f"Parsed line number: {line}")
-            dbg.continue_until(line)
-            log("Waiting for event after continue_until")
-            dbg.wait_for_event()
-            log(f"Sending event: {dbg.last_event.get('event', 'unknown') if dbg.last_event else 'None'}")
-            send_event(dbg.last_event)
-
-        except Exception as e:
-            log_exception(e, "interactive stepping loop")
-            # Don't print to stderr, just log it
-    
+        log(f"Sending final event: {final_event.get('event', 'unknown')} at line {final_event.get('line', 'unknown')}")
+        dbg.send(final_event)
+        if read_stop_line() is None:
+            break
+
     log("Tracer exiting")
     if _log_file:
         _log_file.close()